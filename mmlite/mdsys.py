@@ -1,20 +1,24 @@
 # -*- coding: utf-8 -*-
 """Test systems."""
 # pylint: disable=unused-import, too-few-public-methods, no-member
+# pylint: disable=import-outside-toplevel
+# pylint: disable=too-many-instance-attributes
 import logging
 from abc import ABC  # python >= 3.4
 
 import mdtraj
-import nglview
+import numpy as np
 from openmmtools.testsystems import TestSystem
 from simtk import openmm as mm
 from simtk import unit
 from simtk.openmm import app
-from simtk.openmm.openmm import LangevinIntegrator, VerletIntegrator
+from simtk.openmm.openmm import (LangevinIntegrator, LangevinMiddleIntegrator,
+                                 VerletIntegrator)
 
 from .output import add_screen_output, add_state_output, add_trajectory_output
-from .simulation import (set_simulation_positions, set_simulation_temperature,
-                         simulation_energy)
+from .simulation import (gradient_descent_minimize, resolve_platform,
+                         set_simulation_positions, set_simulation_temperature,
+                         simulation_energy, simulation_state)
 
 logger = logging.getLogger(__name__)
 
@@ -47,6 +51,10 @@ class MdSys(TestSystem, ABC):
         self.temperature = kwargs.pop('temperature', 298.0 * unit.kelvin)
         super().__init__(*args, **kwargs)
         self._simulation = None
+        self._mdtraj_top = None  # (topology, mdtraj topology)
+        self._masses = None  # (system, masses)
+        # (platform, properties) -> (system, integrator config, context)
+        self._contexts = {}
 
     @property
     def n_particles(self):
@@ -55,38 +63,68 @@ class MdSys(TestSystem, ABC):
 
     @property
     def masses(self):
-        """List of particles masses."""
-        return [
-            self.system.getNumParticles(i) for i in range(self.n_particles)
-        ]
+        """Array of particles masses. Cached until the system is reassigned."""
+        cached = self._masses
+        if cached is None or cached[0] is not self._system:
+            n = self.n_particles
+            masses = np.fromiter(
+                (self.system.getParticleMass(i).value_in_unit(unit.dalton)
+                 for i in range(n)),
+                dtype=np.float64,
+                count=n)
+            self._masses = (self._system, unit.Quantity(masses, unit.dalton))
+        return self._masses[1]
 
     def integrator(self):
         """Return a fresh integrator."""
         if self.integrator_class.__name__ == 'VerletIntegrator':
             return VerletIntegrator(self.dt)
+        if self.integrator_class.__name__ == 'LangevinMiddleIntegrator':
+            return LangevinMiddleIntegrator(self.temperature, self.friction,
+                                            self.dt)
         if self.integrator_class.__name__ == 'LangevinIntegrator':
             return LangevinIntegrator(self.temperature, self.friction, self.dt)
         raise ValueError(self.integrator_class)
 
     def langevin_integrator(self):
-        """Return a fresh Langevin integrator."""
-        return mm.LangevinIntegrator(self.temperature, self.friction, self.dt)
+        """Return a fresh Langevin (LangevinMiddleIntegrator) integrator."""
+        return LangevinMiddleIntegrator(self.temperature, self.friction,
+                                        self.dt)
 
     def verlet_integrator(self):
         """Return a fresh Verlet integrator."""
         return mm.VerletIntegrator(self.dt)
 
-    def context(self, xp=None, platform=None, properties=None):
-        """Define an integrator and assign to context."""
-        # We have to create a new integrator for every Context since it takes
-        # ownership of the integrator we pass it
-        args = [self.system, self.integrator()]
-        if platform is not None:
-            platform = mm.Platform.getPlatformByName(platform)
-            args.append(platform)
-        if properties is not None:
-            args.append(properties)
-        context = mm.Context(*args)
+    def context(self, xp=None, platform=None, properties=None, precision=None):
+        """Define an integrator and assign to context.
+
+        If `platform` is None, use the fastest available platform.
+        See `mmlite.simulation.resolve_platform` for properties and precision.
+
+        Contexts are cached by platform and properties: a context (and its
+        integrator) is reused until `reset` is called, or the system or the
+        integrator settings (integrator class, dt, temperature, friction)
+        change. A reused context only has its positions reset: velocities,
+        time and step count are those left by the previous use.
+
+        """
+        platform, properties = resolve_platform(platform, properties,
+                                                precision)
+        key = (platform.getName(),
+               tuple(sorted(properties.items())) if properties else None)
+        config = (self.integrator_class, self.dt, self.temperature,
+                  self.friction)
+        cached = self._contexts.get(key)
+        if (cached is not None and cached[0] is self._system
+                and cached[1] == config):
+            context = cached[2]
+        else:
+            # The Context takes ownership of the integrator we pass it
+            args = [self.system, self.integrator(), platform]
+            if properties is not None:
+                args.append(properties)
+            context = mm.Context(*args)
+            self._contexts[key] = (self._system, config, context)
         if xp is not None:
             context.setPositions(xp)
         elif self.positions is not None:
@@ -97,7 +135,9 @@ class MdSys(TestSystem, ABC):
     def simulation(self):
         """Return a Simulation object."""
         if not self._simulation:
-            sim = app.Simulation(self.topology, self.system, self.integrator())
+            platform, properties = resolve_platform()
+            sim = app.Simulation(self.topology, self.system, self.integrator(),
+                                 platform, properties)
             set_simulation_positions(sim, self.positions)
             set_simulation_temperature(sim, temperature=self.temperature)
             # add reporters
@@ -108,25 +148,44 @@ class MdSys(TestSystem, ABC):
         return self._simulation
 
     def reset(self):
-        """Reinitialize the simulation attribute."""
+        """Reinitialize the simulation attribute and the cached contexts."""
         self._simulation = None
+        self._contexts = {}
+
+    @property
+    def mdtraj_topology(self):
+        """mdtraj Topology. Cached until the topology is reassigned."""
+        cached = getattr(self, '_mdtraj_top', None)
+        if cached is None or cached[0] is not self._topology:
+            self._mdtraj_top = (self._topology,
+                                mdtraj.Topology.from_openmm(self._topology))
+        return self._mdtraj_top[1]
 
     @property
     def mdtraj(self):
         """mdtraj object from actual positions."""
-        top = mdtraj.Topology.from_openmm(self.topology)
-        return mdtraj.Trajectory([self.positions / unit.nanometers], top)
+        xyz = np.asarray(self.positions.value_in_unit(unit.nanometers),
+                         dtype=np.float32)[np.newaxis]
+        # float32 C-contiguous xyz is not copied by mdtraj
+        return mdtraj.Trajectory(xyz, self.mdtraj_topology)
 
     @property
     def view(self):
         """Return a nglview view for the actual positions."""
+        try:
+            import nglview
+        except ImportError as e:
+            raise ImportError('nglview is required to view a system') from e
         view = nglview.show_mdtraj(self.mdtraj)
         if len(self.positions) < 10000:
             view.add_ball_and_stick('all')
         view.center(zoom=True)
         return view
 
-    def minimize(self, tol=10 * unit.kilojoule / unit.mole, max_iter=None):
+    def minimize(self,
+                 tol=10 * unit.kilojoule / unit.mole,
+                 max_iter=None,
+                 accurate=True):
         """Perform a local energy minimization on the system.
 
         Parameters
@@ -137,12 +196,18 @@ class MdSys(TestSystem, ABC):
         max_iter : int=None
             The maximum number of iterations to perform.  If this is 0,
             Default: minimization is continued until the results converge.
+        accurate : bool=True
+            If True, use the L-BFGS minimizer. Otherwise, use `fast_minimize`
+            (`tol` is ignored and max_iter defaults to 500).
 
         Returns
         -------
         Context or Simulation.
 
         """
+        if not accurate:
+            self.fast_minimize(max_iter=max_iter or 500)
+            return
 
         ctx = self.simulation.context
         max_iter = max_iter or 0
@@ -152,10 +217,51 @@ class MdSys(TestSystem, ABC):
         logger.info('Energy after minimization: %s',
                     simulation_energy(ctx)['potential'])
 
+    def fast_minimize(self,
+                      max_iter=500,
+                      initial_step_size=0.01 * unit.angstroms):
+        """Minimize the energy by gradient descent on the context platform.
+
+        See `mmlite.simulation.gradient_descent_minimize`.
+
+        """
+        gradient_descent_minimize(self.simulation.context,
+                                  self.system,
+                                  max_iter=max_iter,
+                                  initial_step_size=initial_step_size)
+
     def step(self, *args, **kwargs):
         """Advance the system by a specified number of time steps."""
         self.simulation.step(*args, **kwargs)
 
+    def step_n_report(self,
+                      n_chunks,
+                      chunk_size,
+                      callback=None,
+                      data='positions energy'):
+        """Advance the system by `n_chunks` chunks of `chunk_size` steps.
+
+        The simulation reporters are invoked as usual; between reports,
+        OpenMM advances the system with a single step call.
+
+        Parameters
+        ----------
+        n_chunks : int
+        chunk_size : int
+            Number of time steps per chunk.
+        callback : callable, optional
+            Called as `callback(self, state)` at the end of each chunk.
+        data : list or str
+            Quantities in the State passed to `callback`.
+            See `mmlite.simulation.simulation_state`.
+
+        """
+        sim = self.simulation
+        for _ in range(n_chunks):
+            sim.step(chunk_size)
+            if callback is not None:
+                callback(self, simulation_state(sim, data=data))
+
     @property
     def reporters(self):
         """List the simulation reporters."""
@@ -4,19 +4,45 @@ import sys
 from pathlib import Path
 
 from mdtraj.reporters import NetCDFReporter
+from simtk.openmm.app.dcdreporter import DCDReporter
 from simtk.openmm.app.pdbreporter import PDBReporter
 from simtk.openmm.app.statedatareporter import StateDataReporter
 
 __all__ = ['add_reporters']
 
+BUFSIZE = 4 * 1024 * 1024  # DCD output files buffer size (bytes)
 
-def add_trajectory_output(simulation, fp='traj.pdb', dt=10):
+
+class BufferedDCDReporter(DCDReporter):
+    """DCDReporter writing to file `fp` with a `bufsize` bytes buffer."""
+    def __init__(self, fp, dt, append=False, bufsize=BUFSIZE, **kwargs):
+        super().__init__(fp, dt, append=append, **kwargs)
+        # nothing has been written yet: reopen with a larger buffer
+        self._out.close()
+        self._out = open(fp, 'r+b' if append else 'wb', buffering=bufsize)
+
+
+def trajectory_reporter(fp, dt, bufsize=BUFSIZE):
+    """Return a trajectory reporter, based on `fp` suffix.
+
+    DCD files are written with a `bufsize` bytes buffer.
+
+    """
+    fp = Path(fp)
+    if fp.suffix == '.dcd':
+        return BufferedDCDReporter(str(fp), dt, bufsize=bufsize)
+    if fp.suffix == '.nc':
+        return NetCDFReporter(str(fp), dt)
+    return PDBReporter(str(fp), dt)
+
+
+def add_trajectory_output(simulation, fp='traj.pdb', dt=10, bufsize=BUFSIZE):
     """Add a trajectory output to simulation object reporters."""
     try:
         fp = Path(fp)
     except TypeError as e:
         raise ValueError('Not a valid output: %r' % fp) from e
-    reporter = PDBReporter(str(fp), dt)
+    reporter = trajectory_reporter(fp, dt, bufsize=bufsize)
     simulation.reporters.append(reporter)
 
 
@@ -47,7 +73,8 @@ def add_reporters(
     outs='traj.pdb data.csv screen'.split(),
     freqs=(1, 1, 100),
     screen='step totalEnergy temperature'.split(),
-    data='step time potentialEnergy totalEnergy temperature'.split()):
+    data='step time potentialEnergy totalEnergy temperature'.split(),
+    bufsize=BUFSIZE):
     """Define the simulation reporters.
 
     Parameters
@@ -61,6 +88,8 @@ def add_reporters(
         Quantities for stdout.
     screen : list
         Quantities for data file.
+    bufsize : int
+        Buffer size (bytes) for DCD output files.
 
     """
 
@@ -82,10 +111,8 @@ def add_reporters(
             else:
                 raise ValueError('Not a valid file: %r' % fp) from e
         else:  # file path
-            if fp.suffix == '.pdb':
-                reporter = PDBReporter(str(fp), dt)
-            elif fp.suffix == '.nc':
-                reporter = NetCDFReporter(str(fp), dt)
+            if fp.suffix in ('.pdb', '.dcd', '.nc'):
+                reporter = trajectory_reporter(fp, dt, bufsize=bufsize)
             elif fp.suffix == '.csv':
                 reporter = StateDataReporter(str(fp), dt,
                                              **{q: True
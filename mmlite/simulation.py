@@ -2,14 +2,17 @@
 """Simulation utils."""
 # pylint: disable=no-member,too-many-arguments
 
+import functools
 import logging
+import os
 
-import parmed
+import numpy as np
 import simtk.openmm as mm
 import simtk.openmm.app as mmapp
 from simtk import unit
 from simtk.openmm import XmlSerializer
-from simtk.openmm.openmm import LangevinIntegrator, State, VerletIntegrator
+from simtk.openmm.openmm import (LangevinIntegrator, LangevinMiddleIntegrator,
+                                 State, VerletIntegrator)
 
 import mmlite.defaults
 from mmlite import SEED
@@ -18,6 +21,94 @@ from .output import add_screen_output, add_state_output, add_trajectory_output
 
 logger = logging.getLogger(__name__)
 
+GPU_PLATFORMS = ('CUDA', 'HIP', 'OpenCL')
+
+
+def _best_platform():
+    """Return the fastest available OpenMM platform.
+
+    The choice can be overridden by setting the `MMLITE_PLATFORM`
+    environment variable to a platform name.
+
+    """
+    name = os.environ.get('MMLITE_PLATFORM')
+    if name:
+        return mm.Platform.getPlatformByName(name)
+    platforms = [
+        mm.Platform.getPlatform(i)
+        for i in range(mm.Platform.getNumPlatforms())
+    ]
+    return max(platforms, key=lambda p: p.getSpeed())
+
+
+def resolve_platform(platform=None, properties=None, precision=None):
+    """Return a (platform, properties) pair for Context creation.
+
+    Parameters
+    ----------
+    platform : str or Platform object, optional
+        If None, use the fastest available platform.
+    properties : dict, optional
+        Platform properties. If None and the platform is a GPU platform,
+        set the precision and (CUDA only) disable blocking sync.
+    precision : str, optional
+        GPU platforms precision: 'single', 'mixed' or 'double'.
+        Defaults to the `MMLITE_PRECISION` environment variable or 'mixed',
+        the precision recommended by OpenMM for MD.
+
+    Returns
+    -------
+    (Platform object, dict or None)
+
+    """
+    if platform is None:
+        platform = _best_platform()
+    elif isinstance(platform, str):
+        platform = mm.Platform.getPlatformByName(platform)
+    name = platform.getName()
+    if properties is None and name in GPU_PLATFORMS:
+        precision = precision or os.environ.get('MMLITE_PRECISION', 'mixed')
+        properties = {'Precision': precision}
+        if name == 'CUDA':
+            properties['UseBlockingSync'] = 'false'
+    return platform, properties
+
+
+# quantities to be requested to Context.getState for each state property
+STATE_KINDS = {
+    'positions': 'positions',
+    'velocities': 'velocities',
+    'forces': 'forces',
+    'energy': 'energy',
+    'potential_energy': 'energy',
+    'kinetic_energy': 'energy',
+    'parameters': 'parameters',
+    'parameter_derivatives': 'parameter_derivatives',
+}
+
+
+@functools.lru_cache(maxsize=32)
+def _normalize_hashable(data):
+    if isinstance(data, str):
+        return tuple(data.split())
+    return tuple(data)
+
+
+def _normalize_data(data):
+    """Return `data` (str or sequence of names) as a tuple of names."""
+    if data is None:
+        return ()
+    try:
+        return _normalize_hashable(data)
+    except TypeError:  # unhashable, e.g. a list
+        return tuple(data)
+
+
+def state_kinds(data):
+    """Return the set of getState quantities needed to extract `data`."""
+    return frozenset(STATE_KINDS[q] for q in _normalize_data(data)
+                     if q in STATE_KINDS)
+
 
 # pylint: disable=too-many-instance-attributes
 class Simulation(mmapp.Simulation):
@@ -36,6 +127,11 @@ class Simulation(mmapp.Simulation):
     * saveState
     * loadState
 
+    If `cache_state` is True, a State fetched from the context is reused by
+    the state accessors until the simulation is advanced or its state is
+    changed through the Simulation methods (changes made directly on the
+    context are not tracked).
+
     """
     def __init__(
             self,  # pylint: disable=super-init-not-called
@@ -43,9 +139,16 @@ class Simulation(mmapp.Simulation):
             integrator=None,
             platform=None,
             platform_properties=None,
-            state=None):
+            state=None,
+            cache_state=False):
 
         self.sys = sys
+        self.cache_state = cache_state
+        self._cached_state = None
+        self._cached_kinds = frozenset()
+        self._cached_step = 0
+        platform, platform_properties = resolve_platform(
+            platform, platform_properties)
         super().__init__(self.sys.topology,
                          self.sys.system,
                          integrator,
@@ -54,7 +157,8 @@ class Simulation(mmapp.Simulation):
                          state=state)
 
         self._state = None
-        self._integrator = None  # current integrator
+        self._structure = {}  # simulation_structure cache
+        self._integrator = self.create_integrator()  # default integrator
         # Initialize a context containing the current state of the simulation
         # If state is passed, initialize from state
         self.setup_context(xp=self.sys.positions,
@@ -81,35 +185,93 @@ class Simulation(mmapp.Simulation):
                       temperature=mmlite.defaults.temperature,
                       platform=None,
                       properties=None,
-                      state=None):
-        """Init an integrator and return a fresh context."""
+                      state=None,
+                      precision=None,
+                      initialize_velocities=False):
+        """Init an integrator and return a fresh context.
+
+        See `resolve_platform` for platform, properties and precision.
+        Velocities are set to `temperature` unless they are loaded from a
+        `state` file; pass `initialize_velocities=True` to set them in any
+        case.
+
+        """
         # We have to create a new integrator for every Context since it takes
         # ownership of the integrator we pass it
-        args = [self.sys.system, self.integrator]
-        if platform is not None:
-            platform = mm.Platform.getPlatformByName(platform)
-            args.append(platform)
+        platform, properties = resolve_platform(platform, properties,
+                                                precision)
+        args = [self.sys.system, self.integrator, platform]
         if properties is not None:
             args.append(properties)
         context = mm.Context(*args)
         if xp is not None:
             context.setPositions(xp)
-        if temperature:
-            context.setVelocitiesToTemperature(temperature, SEED)
         # Initialize from state
+        has_velocities = False
         if state is not None:
             with open(state, 'r') as f:
-                self.context.setState(mm.XmlSerializer.deserialize(f.read()))
+                state = mm.XmlSerializer.deserialize(f.read())
+            context.setState(state)
+            has_velocities = _has_velocities(state)
+        if temperature and (initialize_velocities or not has_velocities):
+            context.setVelocitiesToTemperature(temperature, SEED)
 
         self.context = context
+        self._invalidate_state()
         return context
 
+    def _getState(self, want):  # pylint: disable=invalid-name
+        """Return a State containing the quantities in `want`.
+
+        All the quantities are fetched with a single getState call.
+        If `cache_state`, a State cached at the current step is reused if it
+        contains all the wanted quantities; otherwise the union of the wanted
+        and the cached quantities is fetched and cached.
+
+        """
+        want = frozenset(want)
+        if self._cached_state is not None and (self.currentStep !=
+                                               self._cached_step):
+            self._invalidate_state()
+        if self._cached_state is not None and want <= self._cached_kinds:
+            return self._cached_state
+        if self.cache_state:
+            want = want | self._cached_kinds
+        state = simulation_state(self.context, data=want, pbc=False)
+        if self.cache_state:
+            self._cached_state = state
+            self._cached_kinds = want
+            self._cached_step = self.currentStep
+        return state
+
+    def _invalidate_state(self):
+        """Discard the cached State."""
+        self._cached_state = None
+        self._cached_kinds = frozenset()
+
+    def step(self, steps):
+        """Advance the simulation by `steps` time steps."""
+        self._invalidate_state()
+        super().step(steps)
+
+    def minimizeEnergy(self, *args, **kwargs):  # pylint: disable=invalid-name
+        """Perform a local energy minimization on the system."""
+        self._invalidate_state()
+        super().minimizeEnergy(*args, **kwargs)
+
+    def loadState(self, *args, **kwargs):  # pylint: disable=invalid-name
+        """Load a State from a file."""
+        self._invalidate_state()
+        super().loadState(*args, **kwargs)
+
+    def loadCheckpoint(self, *args, **kwargs):  # pylint: disable=invalid-name
+        """Load a checkpoint from a file."""
+        self._invalidate_state()
+        super().loadCheckpoint(*args, **kwargs)
+
     @property
     def integrator(self):
         """The actual integrator."""
-        if self._integrator is None:
-            # set to the default integrator
-            self._integrator = self.create_integrator()
         return self._integrator
 
     @integrator.setter
@@ -118,19 +280,32 @@ class Simulation(mmapp.Simulation):
 
     @staticmethod
     def create_integrator(name='verlet', dt=1 * unit.femtoseconds, **kwargs):
-        """Return a fresh integrator."""
+        """Return a fresh integrator.
+
+        `name` is one of 'verlet', 'langevin' (LangevinMiddleIntegrator) or
+        'langevin-classic' (LangevinIntegrator).
+
+        """
         if name == 'verlet':
             return VerletIntegrator(dt)
-        if name == 'langevin':
+        if name in ('langevin', 'langevin-classic'):
             temperature = kwargs.pop('temperature',
                                      mmlite.defaults.temperature)
             friction = kwargs.pop('friction', mmlite.defaults.friction)
+            if name == 'langevin':
+                return LangevinMiddleIntegrator(temperature, friction, dt)
             return LangevinIntegrator(temperature, friction, dt)
         raise ValueError(name)
 
-    def serialize(self):
+    def serialize(self, via_reference=False):
         """Return the System and positions in serialized XML form.
 
+        Parameters
+        ----------
+        via_reference : bool, optional
+            Compute the State in a throwaway Reference platform context.
+            Default: take the State from the current context.
+
         Returns
         -------
 
@@ -149,6 +324,9 @@ class Simulation(mmapp.Simulation):
         if self._system.getNumParticles() == 0:
             # Cannot serialize the State of a system with no particles.
             state_xml = None
+        elif not via_reference:
+            state = self._getState({'positions'})
+            state_xml = XmlSerializer.serialize(state)
         else:
             platform = mm.Platform.getPlatformByName('Reference')
             integrator = mm.VerletIntegrator(1.0 * unit.femtoseconds)
@@ -160,7 +338,10 @@ class Simulation(mmapp.Simulation):
 
         return (system_xml, state_xml)
 
-    def minimize(self, tol=10 * unit.kilojoule / unit.mole, max_iter=0):
+    def minimize(self,
+                 tol=10 * unit.kilojoule / unit.mole,
+                 max_iter=0,
+                 accurate=True):
         """Perform a local energy minimization on the system.
 
         Parameters
@@ -171,33 +352,58 @@ class Simulation(mmapp.Simulation):
         max_iter : int=None
             The maximum number of iterations to perform.  If this is 0,
             Default: minimization is continued until the results converge.
+        accurate : bool=True
+            If True, use the L-BFGS minimizer. Otherwise, use `fast_minimize`
+            (`tol` is ignored and max_iter defaults to 500).
 
         Returns
         -------
         Context or Simulation.
 
         """
+        if not accurate:
+            self.fast_minimize(max_iter=max_iter or 500)
+            return
+
         logger.info('Energy before minimization: %s',
-                    simulation_energy(self.context)['potential'])
+                    simulation_energy(self)['potential'])
 
         self.minimizeEnergy(tolerance=tol, maxIterations=max_iter)
 
         logger.info('Energy after minimization: %s',
-                    simulation_energy(self.context)['potential'])
+                    simulation_energy(self)['potential'])
+
+    def fast_minimize(self,
+                      max_iter=500,
+                      initial_step_size=0.01 * unit.angstroms):
+        """Minimize the energy by gradient descent on the context platform.
+
+        See `gradient_descent_minimize`.
+
+        """
+        gradient_descent_minimize(self.context,
+                                  self.system,
+                                  max_iter=max_iter,
+                                  initial_step_size=initial_step_size)
+        self._invalidate_state()
+
+    def get_positions(self):
+        """Return the actual positions."""
+        return self._getState({'positions'}).getPositions(asNumpy=True)
 
     @property
     def positions(self):
-        """Actual positions."""
-        state = simulation_state(self, data='positions')
-        return state_data(state, data='positions')
+        """Actual positions. Prefer `get_positions()` in loops."""
+        return self.get_positions()
 
     @positions.setter
     def positions(self, value):
-        self.context.setPositions(value)
+        set_simulation_positions(self, value)
+        self._invalidate_state()
 
     def update_state(self, data='positions'):
         """Update simulation state."""
-        self._state = simulation_state(self, data=data)
+        self._state = self._getState(state_kinds(data))
 
     def get_state(self, data='positions'):
         """Return simulation state."""
@@ -211,10 +417,38 @@ class Simulation(mmapp.Simulation):
     def state(self, value):
         self._state = value
         self.context.setState(value)
+        self._invalidate_state()
 
     def data(self, qs):
         """Return quantities from simulation state."""
-        return state_data(self.state, qs)
+        return state_data(self._getState(state_kinds(qs)), qs)
+
+    def get_structure(self, velocities=False):
+        """Return a parmed Structure object for the actual state.
+
+        The Structure is built once and updated at each call.
+
+        """
+        return simulation_structure(self,
+                                    velocities=velocities,
+                                    cache=self._structure)
+
+
+def _has_velocities(state):
+    """True if `state` contains velocities."""
+    try:
+        state.getVelocities()
+    except Exception:  # pylint: disable=broad-except
+        # OpenMM raises Exception if the State has no velocities
+        return False
+    return True
+
+
+def _simulation_state(simulation, data):
+    """Return a State, using the Simulation batched getState if available."""
+    if isinstance(simulation, Simulation):
+        return simulation._getState(state_kinds(data))  # pylint: disable=protected-access
+    return simulation_state(simulation, data)
 
 
 def camelcase(a):
@@ -222,6 +456,28 @@ def camelcase(a):
     return a.title().replace('_', '')
 
 
+# state property name -> (State method name, asNumpy flag)
+_PROP_TABLE = {
+    'positions': ('getPositions', True),
+    'velocities': ('getVelocities', True),
+    'forces': ('getForces', True),
+    'periodic_box_vectors': ('getPeriodicBoxVectors', True),
+    'periodic_box_volume': ('getPeriodicBoxVolume', False),
+    'potential_energy': ('getPotentialEnergy', False),
+    'kinetic_energy': ('getKineticEnergy', False),
+    'time': ('getTime', False),
+    'step_count': ('getStepCount', False),
+    'parameters': ('getParameters', False),
+    'parameter_derivatives': ('getEnergyParameterDerivatives', False),
+}
+
+# state property name -> Context.getState flag
+_GETSTATE_FLAGS = {
+    name: 'get' + camelcase(kind)
+    for name, kind in STATE_KINDS.items()
+}
+
+
 def state_property(state, property_name):
     """Return the value of a state property from quantity_name.
 
@@ -238,16 +494,17 @@ def state_property(state, property_name):
     value/list of values.
 
     """
-    if isinstance(property_name, str) and len(property_name.split()) == 1:
-        method_name = 'get' + camelcase(property_name)
+    if isinstance(property_name, str):
+        try:
+            method_name, use_numpy = _PROP_TABLE[property_name]
+        except KeyError:
+            names = property_name.split()
+            if len(names) > 1:
+                return [state_property(state, q) for q in names]
+            method_name, use_numpy = 'get' + camelcase(names[0]), False
         method = getattr(state, method_name)
-        kwargs = {}
-        if property_name in 'forces periodic_box_vectors positions velocities':
-            kwargs['asNumpy'] = True
-        return method(**kwargs)
+        return method(asNumpy=True) if use_numpy else method()
 
-    if isinstance(property_name, str):
-        property_name = property_name.split()
     return [state_property(state, q) for q in property_name]
 
 
@@ -259,12 +516,9 @@ def state_data(state, data='positions'):
 
     """
 
-    if isinstance(data, str):
-        data = data.split()
+    data = _normalize_data(data)
 
-    result = []
-    for q in data:
-        result.append(state_property(state, q))
+    result = [state_property(state, q) for q in data]
     return result if len(data) > 1 else result[0]
 
 
@@ -299,13 +553,7 @@ def simulation_state(simulation, data='positions', pbc=False, groups=-1):
     except AttributeError:
         context = simulation
 
-    if isinstance(data, str):
-        data = data.split()
-
-    if data:
-        data = {'get' + camelcase(a): True for a in data}
-    else:
-        data = {}
+    data = {_GETSTATE_FLAGS[a]: True for a in _normalize_data(data)}
 
     return context.getState(**data, enforcePeriodicBox=pbc, groups=groups)
 
@@ -336,13 +584,7 @@ def context_state(context, data='positions', pbc=True, groups=-1):
     if isinstance(context, State):  # if a State object, just return
         return context
 
-    if isinstance(data, str):
-        data = data.split()
-
-    if data:
-        data = {'get' + camelcase(a): True for a in data}
-    else:
-        data = {}
+    data = {_GETSTATE_FLAGS[a]: True for a in _normalize_data(data)}
 
     return context.getState(**data, enforcePeriodicBox=pbc, groups=groups)
 
@@ -391,7 +633,7 @@ def simulation_energy(simulation):
 
     """
 
-    state = simulation_state(simulation, 'energy')
+    state = _simulation_state(simulation, 'energy')
 
     return {
         'potential': state.getPotentialEnergy(),
@@ -399,13 +641,15 @@ def simulation_energy(simulation):
     }
 
 
-def simulation_positions(simulation):
+def simulation_positions(simulation, raw=False):
     """
     Return atomic coordinates.
 
     Parameters
     ----------
     simulation : Simulation or Context object.
+    raw : bool, optional
+        If True, return a bare ndarray (nanometers) with no units.
 
     Returns
     -------
@@ -413,9 +657,10 @@ def simulation_positions(simulation):
 
     """
 
-    state = simulation_state(simulation, 'positions')
+    state = _simulation_state(simulation, 'positions')
+    positions = state.getPositions(asNumpy=True)
 
-    return state.getPositions(asNumpy=True)
+    return positions.value_in_unit(unit.nanometers) if raw else positions
 
 
 def simulation_forces(simulation):
@@ -432,7 +677,7 @@ def simulation_forces(simulation):
 
     """
 
-    state = simulation_state(simulation, 'forces')
+    state = _simulation_state(simulation, 'forces')
 
     return state.getForces(asNumpy=True)
 
@@ -451,7 +696,7 @@ def simulation_velocities(simulation):
 
     """
 
-    state = simulation_state(simulation, 'velocities')
+    state = _simulation_state(simulation, 'velocities')
 
     return state.getVelocities(asNumpy=True)
 
@@ -467,15 +712,126 @@ def set_simulation_temperature(simulation, temperature=298):
 
 
 def set_simulation_positions(simulation, xp):
-    """Set positions to `xp`."""
+    """Set positions to `xp`.
+
+    Arrays (with or without units) are passed to the context as contiguous
+    float64 arrays in nanometers, avoiding per-element conversions.
+
+    """
     try:
         context = simulation.context
     except AttributeError:
         context = simulation
+    if unit.is_quantity(xp) and isinstance(xp._value, np.ndarray):  # pylint: disable=protected-access
+        xp = xp.value_in_unit(unit.nanometers)
+    if isinstance(xp, (np.ndarray, memoryview)):
+        xp = np.ascontiguousarray(xp, dtype=np.float64)
     context.setPositions(xp)
 
 
-def simulation_structure(simulation, velocities=False):
+def gradient_descent_integrator(initial_step_size=0.01 * unit.angstroms):
+    """Return a gradient descent minimization CustomIntegrator.
+
+    Each step moves the positions along the forces and is accepted only if
+    the energy decreases; the step size is doubled after accepted steps and
+    halved otherwise. Same as openmmtools GradientDescentMinimizationIntegrator.
+
+    Parameters
+    ----------
+    initial_step_size : Quantity, optional
+        Initial step size (length units). Default: 0.01 angstroms.
+
+    Returns
+    -------
+    CustomIntegrator object.
+
+    """
+    integrator = mm.CustomIntegrator(1.0 * unit.femtoseconds)
+
+    integrator.addGlobalVariable('step_size',
+                                 initial_step_size / unit.nanometers)
+    integrator.addGlobalVariable('energy_old', 0)
+    integrator.addGlobalVariable('energy_new', 0)
+    integrator.addGlobalVariable('delta_energy', 0)
+    integrator.addGlobalVariable('accept', 0)
+    integrator.addGlobalVariable('fnorm2', 0)
+    integrator.addPerDofVariable('x_old', 0)
+
+    integrator.addUpdateContextState()
+    integrator.addConstrainPositions()
+
+    # store old energy and positions
+    integrator.addComputeGlobal('energy_old', 'energy')
+    integrator.addComputePerDof('x_old', 'x')
+
+    # take a step along the normalized forces
+    integrator.addComputeSum('fnorm2', 'f^2')
+    integrator.addComputePerDof('x',
+                                'x+step_size*f/sqrt(fnorm2 + delta(fnorm2))')
+    integrator.addConstrainPositions()
+
+    # only keep downhill steps (rejects NaN energies, too)
+    integrator.addComputeGlobal('energy_new', 'energy')
+    integrator.addComputeGlobal('delta_energy', 'energy_new-energy_old')
+    integrator.addComputeGlobal(
+        'accept', 'step(-delta_energy) * delta(energy - energy_new)')
+    integrator.addComputePerDof('x', 'accept*x + (1-accept)*x_old')
+
+    # update step size
+    integrator.addComputeGlobal(
+        'step_size', 'step_size * (2.0*accept + 0.5*(1-accept))')
+
+    return integrator
+
+
+def gradient_descent_minimize(context,
+                              system,
+                              max_iter=500,
+                              initial_step_size=0.01 * unit.angstroms):
+    """Minimize the energy of `context` by gradient descent.
+
+    Positions and forces stay on the device for the whole minimization:
+    a temporary context with a `gradient_descent_integrator` is created on
+    the same platform (with the same platform properties and context
+    parameters), and the minimized positions are copied back into
+    `context`. The integrator of `context` is left untouched.
+
+    Parameters
+    ----------
+    context : Context object
+    system : System object
+        The system of `context`.
+    max_iter : int, optional
+        Number of gradient descent steps. Default: 500.
+    initial_step_size : Quantity, optional
+        Initial step size (length units). Default: 0.01 angstroms.
+
+    """
+    logger.info('Energy before minimization: %s',
+                simulation_energy(context)['potential'])
+
+    state = context.getState(getPositions=True)  # pylint: disable=unexpected-keyword-arg, no-value-for-parameter
+    integrator = gradient_descent_integrator(initial_step_size)
+    platform = context.getPlatform()
+    properties = {
+        name: platform.getPropertyValue(context, name)
+        for name in platform.getPropertyNames()
+    }
+    gd_context = mm.Context(system, integrator, platform, properties)
+    for name, value in context.getParameters().items():
+        gd_context.setParameter(name, value)
+    gd_context.setPeriodicBoxVectors(*state.getPeriodicBoxVectors())
+    gd_context.setPositions(state.getPositions())
+    integrator.step(max_iter)
+    state = gd_context.getState(getPositions=True)  # pylint: disable=unexpected-keyword-arg, no-value-for-parameter
+    del gd_context, integrator
+    context.setPositions(state.getPositions())
+
+    logger.info('Energy after minimization: %s',
+                simulation_energy(context)['potential'])
+
+
+def simulation_structure(simulation, velocities=False, cache=None):
     """
     Extract a parmed Structure object from `simulation`.
 
@@ -485,6 +841,10 @@ def simulation_structure(simulation, velocities=False):
         OpenMM Simulation object.
     velocities : bool, optional
         Store velocities, defaults to False.
+    cache : dict, optional
+        If passed, the Structure built from the simulation topology and
+        system is stored in `cache` and reused (only positions/velocities
+        are updated) as long as topology and system are the same objects.
 
     Returns
     -------
@@ -497,9 +857,18 @@ def simulation_structure(simulation, velocities=False):
         data.append('velocities')
 
     state = simulation_state(simulation, data=data, pbc=True)
-    positions, velocities = state_data(state, data=data)
-    structure = parmed.openmm.load_topology(simulation.topology,
-                                            simulation.system)
-    structure.positions = positions
-    structure.velocities = velocities
+
+    topology, system = simulation.topology, simulation.system
+    cached = cache.get('structure') if cache is not None else None
+    if cached is None or cached[0] is not topology or cached[1] is not system:
+        import parmed  # pylint: disable=import-outside-toplevel
+        cached = (topology, system,
+                  parmed.openmm.load_topology(topology, system))
+        if cache is not None:
+            cache['structure'] = cached
+    structure = cached[2]
+
+    structure.positions = state_property(state, 'positions')
+    structure.velocities = (state_property(state, 'velocities')
+                            if velocities else None)
     return structure
@@ -2,17 +2,20 @@
 """Simulation utils."""
 # pylint: disable=no-member
 # pylint: disable=too-many-instance-attributes
+# pylint: disable=import-outside-toplevel
 
-import copy
+import hashlib
 import logging
+import os
+import pickle
+import tempfile
+from pathlib import Path
 
 import mdtraj
+import numpy as np
 import simtk.openmm as mm
-from parmed import load_file
 from simtk import unit
 
-import mmlite.plot
-
 logger = logging.getLogger(__name__)
 
 # https://github.com/openmm/openmm/issues/2330
@@ -24,6 +27,65 @@ SYSTEM_DEFAULTS = {
     'ewaldErrorTolerance': 5.e-4
 }
 
+SYSTEM_CACHE_DIR = Path.home() / '.cache' / 'mmlite' / 'systems'
+
+# createSystem option values with a stable repr
+_STABLE_OPTIONS = (mm.app.NoCutoff, mm.app.CutoffNonPeriodic,
+                   mm.app.CutoffPeriodic, mm.app.Ewald, mm.app.PME,
+                   mm.app.LJPME, mm.app.HBonds, mm.app.AllBonds,
+                   mm.app.HAngles)
+
+
+def _has_stable_repr(value):
+    """True if repr(value) does not change between runs."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return True
+    if unit.is_quantity(value):
+        return isinstance(value.value_in_unit(value.unit), (int, float))
+    return any(value is option for option in _STABLE_OPTIONS)
+
+
+def system_cache_key(pdb, ff, args):
+    """SHA-256 hex digest of a pdb file, forcefield files and system args.
+
+    Local forcefield files are hashed by content, OpenMM builtin forcefields
+    by name (and OpenMM version). Return None if `pdb` is not a path or
+    an argument value has no stable repr (the system can't be cached).
+
+    """
+    if not isinstance(pdb, (str, os.PathLike)):
+        return None
+    if not all(_has_stable_repr(v) for v in args.values()):
+        return None
+    h = hashlib.sha256()
+    with open(pdb, 'rb') as fp:
+        h.update(fp.read())
+    h.update(mm.Platform.getOpenMMVersion().encode())
+    for name in sorted(ff):
+        h.update(name.encode())
+        if Path(name).is_file():
+            with open(name, 'rb') as fp:
+                h.update(fp.read())
+    h.update(repr(sorted(args.items())).encode())
+    return h.hexdigest()
+
+
+def _write_atomically(target, write):
+    """Call `write(path)` on a temporary file, then move it to `target`."""
+    fd, tmp = tempfile.mkstemp(dir=Path(target).parent, suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, target)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _dump_pickle(obj, target):
+    with open(target, 'wb') as fp:
+        pickle.dump(obj, fp)
+
 
 class SystemMixin:
     """Add methods to TestSystem."""
@@ -44,19 +106,41 @@ class SystemMixin:
 
     @property
     def masses(self):
-        """List of particles masses."""
-        return [
-            self.system.getNumParticles(i) for i in range(self.n_particles)
-        ]
+        """Array of particles masses. Cached until the system is reassigned."""
+        cached = getattr(self, '_masses', None)
+        if cached is None or cached[0] is not self._system:
+            n = self.n_particles
+            masses = np.fromiter(
+                (self.system.getParticleMass(i).value_in_unit(unit.dalton)
+                 for i in range(n)),
+                dtype=np.float64,
+                count=n)
+            self._masses = (self._system, unit.Quantity(masses, unit.dalton))
+        return self._masses[1]
+
+    @property
+    def mdtraj_topology(self):
+        """mdtraj Topology. Cached until the topology is reassigned."""
+        cached = getattr(self, '_mdtraj_top', None)
+        if cached is None or cached[0] is not self._topology:
+            self._mdtraj_top = (self._topology,
+                                mdtraj.Topology.from_openmm(self._topology))
+        return self._mdtraj_top[1]
 
     @property
     def mdtraj(self):
         """mdtraj object from actual positions."""
-        top = mdtraj.Topology.from_openmm(self.topology)
-        return mdtraj.Trajectory([self.positions / unit.nanometers], top)
+        return mdtraj.Trajectory([self.positions / unit.nanometers],
+                                 self.mdtraj_topology)
 
     def get_view(self, stride=None, atom_indices=None, top=None, **kwargs):
         """Return a nglview view for the actual positions."""
+        try:
+            import mmlite.plot
+        except ImportError as e:
+            raise ImportError(
+                'mmlite.plot dependencies (e.g. nglview) are required to view '
+                'a system') from e
         # view = nglview.show_mdtraj(self.mdtraj)
         # mmlite.plot.setup_view(view, top=top, **kwargs)
         view = mmlite.plot.show_mdtraj(self.mdtraj,
@@ -71,7 +155,12 @@ class SystemMixin:
         """Return the default ngl view."""
         return self.get_view()
 
-    def from_pdb(self, pdb, *, ff=('amber99sb.xml', 'tip3p.xml'), **kwargs):
+    def from_pdb(self,
+                 pdb,
+                 *,
+                 ff=('amber99sb.xml', 'tip3p.xml'),
+                 cache=True,
+                 **kwargs):
         """
         Setup System object from pdb file.
 
@@ -82,16 +171,47 @@ class SystemMixin:
         pdb : filename
         ff : list
             List of forcefield files
+        cache : bool, optional
+            Reuse/store the system, topology and positions in
+            SYSTEM_CACHE_DIR. Default: True.
+            Caching is skipped if `pdb` is a file object or if some
+            createSystem argument is not a number, string, unit quantity or
+            OpenMM option constant. Cache files are never evicted.
 
         """
+        args = {**SYSTEM_DEFAULTS, **kwargs}
+
+        key = system_cache_key(pdb, ff, args) if cache else None
+        if key:
+            system_xml = SYSTEM_CACHE_DIR / (key + '.xml')
+            topology_pkl = SYSTEM_CACHE_DIR / (key + '.top.pkl')
+            if system_xml.exists() and topology_pkl.exists():
+                logger.debug('Load system from cache: %s', system_xml)
+                try:
+                    self.read_system_from_xml(system_xml)
+                    with open(topology_pkl, 'rb') as fp:
+                        self._topology, self._positions = pickle.load(fp)
+                except Exception:  # pylint: disable=broad-except
+                    logger.warning('Invalid cache entry %s: rebuild', key)
+                else:
+                    return
+
         pdb = mm.app.PDBFile(pdb)
         forcefield = mm.app.ForceField(*ff)
-        args = copy.deepcopy(SYSTEM_DEFAULTS)
-        args.update(kwargs)
         self._topology = pdb.getTopology()
         self._system = forcefield.createSystem(pdb.topology, **args)
         self._positions = pdb.getPositions(asNumpy=True)
 
+        if key:
+            try:
+                SYSTEM_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                _write_atomically(system_xml, self.write_system_to_xml)
+                _write_atomically(
+                    topology_pkl, lambda path: _dump_pickle(
+                        (self._topology, self._positions), path))
+            except OSError as e:
+                logger.warning('Cannot write system cache: %s', e)
+
     def from_gro(self, gro, top, **kwargs):
         """
         Setup System object from Gromacs .gro and .top file.
@@ -106,12 +226,12 @@ class SystemMixin:
             Dict of createSystem parameters.
 
         """
+        from parmed import load_file
         coords = load_file(gro)
         top = load_file(top)
         top.box = coords.box
 
-        args = copy.deepcopy(SYSTEM_DEFAULTS)
-        args.update(kwargs)
+        args = {**SYSTEM_DEFAULTS, **kwargs}
 
         self._topology = top.topology
         self._system = top.createSystem(**args)
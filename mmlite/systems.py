@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 """MdSys systems."""
+import copy
+import functools
 import logging
 
 import numpy as np
@@ -16,18 +18,28 @@ class Water(SystemMixin, testsystems.TestSystem):
     """Create a single tip3pfb water molecule."""
     def __init__(self):
         super().__init__()
-        self._topology = self.def_topology()
-        self._positions = unit.Quantity(
+        topology, system, positions = self.build()
+        # each instance owns its own (mutable) system and positions
+        self._topology = topology
+        self._system = copy.deepcopy(system)
+        self._positions = copy.deepcopy(positions)
+
+    @classmethod
+    @functools.lru_cache(maxsize=1)
+    def build(cls):
+        """Return the (topology, system, positions) triple. Cached."""
+        topology = cls.def_topology()
+        positions = unit.Quantity(
             np.array([[0.0, 0.0, 0.0], [0.0, 0.0, 1.0], [0.0, 1.0, 0.0]]),
             unit.angstroms)
         # load the forcefield for tip3pfb
         ff = mm.app.ForceField('amber14/tip3pfb.xml')
-        self._system = ff.createSystem(
-            self.topology,
-            nonbondedCutoff=mm.NonbondedForce.NoCutoff,
-            constraints=None,
-            rigidWater=False,
-            removeCMMotion=True)
+        system = ff.createSystem(topology,
+                                 nonbondedCutoff=mm.NonbondedForce.NoCutoff,
+                                 constraints=None,
+                                 rigidWater=False,
+                                 removeCMMotion=True)
+        return topology, system, positions
 
     @staticmethod
     def def_topology():
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring
+# pylint: disable=redefined-outer-name
+# pylint: disable=protected-access
+"""Tests for state data helpers."""
+import pytest
+
+from mmlite.simulation import (_GETSTATE_FLAGS, _normalize_data, state_data,
+                               state_kinds, state_property)
+
+
+class FakeState:
+    """Record the State methods called and their kwargs."""
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        if not name.startswith('get'):
+            raise AttributeError(name)
+
+        def method(**kwargs):
+            self.calls.append((name, kwargs))
+            return name
+
+        return method
+
+
+@pytest.mark.parametrize('data', [
+    'positions velocities', ['positions', 'velocities'],
+    ('positions', 'velocities')
+])
+def test_normalize_data(data):
+    assert _normalize_data(data) == ('positions', 'velocities')
+
+
+def test_normalize_data_frozenset():
+    assert sorted(_normalize_data(frozenset(['positions', 'forces'
+                                             ]))) == ['forces', 'positions']
+
+
+def test_normalize_data_none():
+    assert _normalize_data(None) == ()
+
+
+@pytest.mark.parametrize('data', [
+    'positions potential_energy kinetic_energy time',
+    ['positions', 'potential_energy', 'kinetic_energy', 'time'],
+    frozenset(['positions', 'potential_energy', 'kinetic_energy', 'time'])
+])
+def test_state_kinds(data):
+    assert state_kinds(data) == frozenset(['positions', 'energy'])
+
+
+def test_getstate_flags():
+    assert _GETSTATE_FLAGS['positions'] == 'getPositions'
+    assert _GETSTATE_FLAGS['potential_energy'] == 'getEnergy'
+    assert _GETSTATE_FLAGS['kinetic_energy'] == 'getEnergy'
+    assert _GETSTATE_FLAGS['parameter_derivatives'] == \
+        'getParameterDerivatives'
+
+
+@pytest.mark.parametrize('name, call', [
+    ('positions', ('getPositions', {
+        'asNumpy': True
+    })),
+    ('forces', ('getForces', {
+        'asNumpy': True
+    })),
+    ('potential_energy', ('getPotentialEnergy', {})),
+    ('parameter_derivatives', ('getEnergyParameterDerivatives', {})),
+])
+def test_state_property_table(name, call):
+    state = FakeState()
+    state_property(state, name)
+    assert state.calls == [call]
+
+
+def test_state_property_fallback():
+    state = FakeState()
+    assert state_property(state, 'foo_bar') == 'getFooBar'
+    assert state.calls == [('getFooBar', {})]
+
+
+def test_state_property_multiple_names():
+    state = FakeState()
+    assert state_property(state,
+                          'positions time') == ['getPositions', 'getTime']
+    assert state_property(state, ['time']) == ['getTime']
+
+
+def test_state_data():
+    state = FakeState()
+    assert state_data(state, 'time') == 'getTime'
+    assert state_data(state, ['time', 'step_count'
+                              ]) == ['getTime', 'getStepCount']
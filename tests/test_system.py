@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring
+# pylint: disable=redefined-outer-name
+"""Tests for the system cache key."""
+import io
+
+import pytest
+import simtk.openmm as mm
+from simtk import unit
+
+from mmlite.system import SYSTEM_DEFAULTS, system_cache_key
+
+PDB = 'REMARK test\nEND\n'
+
+
+@pytest.fixture
+def pdb(tmp_path):
+    path = tmp_path / 'test.pdb'
+    path.write_text(PDB)
+    return str(path)
+
+
+def test_key_is_stable(pdb):
+    args = dict(SYSTEM_DEFAULTS)
+    key = system_cache_key(pdb, ('amber99sb.xml', 'tip3p.xml'), args)
+    assert key is not None
+    assert key == system_cache_key(pdb, ('amber99sb.xml', 'tip3p.xml'),
+                                   dict(SYSTEM_DEFAULTS))
+
+
+def test_key_ignores_ff_order(pdb):
+    args = dict(SYSTEM_DEFAULTS)
+    assert system_cache_key(pdb, ('a.xml', 'b.xml'), args) == \
+        system_cache_key(pdb, ('b.xml', 'a.xml'), args)
+
+
+def test_key_depends_on_args(pdb):
+    ff = ('amber99sb.xml', )
+    args = dict(SYSTEM_DEFAULTS)
+    other = {**args, 'nonbondedCutoff': 0.9 * unit.nanometer}
+    assert system_cache_key(pdb, ff, args) != system_cache_key(pdb, ff, other)
+    other = {**args, 'constraints': mm.app.AllBonds}
+    assert system_cache_key(pdb, ff, args) != system_cache_key(pdb, ff, other)
+
+
+def test_key_depends_on_local_ff_content(pdb, tmp_path):
+    ff = tmp_path / 'ff.xml'
+    ff.write_text('<ForceField/>')
+    key = system_cache_key(pdb, (str(ff), ), SYSTEM_DEFAULTS)
+    ff.write_text('<ForceField></ForceField>')
+    assert key != system_cache_key(pdb, (str(ff), ), SYSTEM_DEFAULTS)
+
+
+def test_no_key_for_file_object():
+    assert system_cache_key(io.StringIO(PDB), ('amber99sb.xml', ),
+                            SYSTEM_DEFAULTS) is None
+
+
+def test_no_key_for_unstable_repr(pdb):
+    args = {**SYSTEM_DEFAULTS, 'residueTemplates': {object(): 'HOH'}}
+    assert system_cache_key(pdb, ('amber99sb.xml', ), args) is None